@@ -4,18 +4,59 @@ Claude History Viewer - FastAPI Backend
 """
 import os
 import json
+import asyncio
+import hashlib
+import mmap
+import heapq
+import itertools
+from urllib.parse import quote
 from pathlib import Path
 from datetime import datetime
-from collections import defaultdict
-from typing import Optional
+from collections import Counter, defaultdict
+from operator import itemgetter
+from typing import Any, List, Optional, Union
 import shutil
-from fastapi import FastAPI, HTTPException
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import AsyncOpenAI
 
-app = FastAPI(title="Claude History Viewer", version="1.0.0")
+# JSON解析：优先使用orjson，未安装时回退到标准库
+# orjson.JSONDecodeError 继承自 json.JSONDecodeError，两者均可直接解析bytes
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# 会话消息解析：安装了pysimdjson时按需读取字段，不为整行构建完整dict
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+# simdjson.Parser 不能跨线程共享，每个线程各自创建一个并重复使用
+_simd_local = threading.local()
+
+# 会话统计解析：安装了msgspec时按声明的字段解码，消息正文等未声明字段在C层跳过
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # asyncio.to_thread 使用事件循环的默认线程池，放宽其并发上限
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=64))
+    yield
+
+
+app = FastAPI(title="Claude History Viewer", version="1.0.0", lifespan=lifespan)
 
 # Claude配置目录
 CLAUDE_DIR = Path.home() / ".claude"
@@ -26,13 +67,30 @@ PROJECTS_DIR = CLAUDE_DIR / "projects"
 APP_DIR = Path(__file__).parent
 CONFIG_FILE = APP_DIR / "config.json"
 REPORTS_DIR = APP_DIR / "reports"
+CACHE_DIR = APP_DIR / "cache"
+HISTORY_INDEX_FILE = CACHE_DIR / "history.index.json"
+SESSION_INDEX_DIR = CACHE_DIR / "sessions"
+ANALYSIS_CACHE_DIR = CACHE_DIR / "analysis"
+
+
+# 配置文件解析缓存：(mtime_ns, size, 配置)，文件未变化时不重新读取
+_config_cache = {"entry": (None, None, None)}
 
 
 def load_config():
     """加载配置文件"""
-    if CONFIG_FILE.exists():
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    try:
+        st = CONFIG_FILE.stat()
+    except OSError:
+        st = None
+    if st is not None:
+        mtime_ns, size, config = _config_cache["entry"]
+        if mtime_ns != st.st_mtime_ns or size != st.st_size:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            _config_cache["entry"] = (st.st_mtime_ns, st.st_size, config)
+        # 返回浅拷贝，调用方替换顶层字段不影响缓存
+        return dict(config)
     return {
         "openai": {
             "api_key": "",
@@ -46,6 +104,8 @@ def save_config(config):
     """保存配置文件"""
     with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
         json.dump(config, f, indent=4, ensure_ascii=False)
+    # mtime精度不足时同一时刻的两次写入可能无法区分，写入后直接作废缓存
+    _config_cache["entry"] = (None, None, None)
 
 
 def get_openai_client():
@@ -56,7 +116,7 @@ def get_openai_client():
     if not openai_config.get("api_key"):
         return None
 
-    return OpenAI(
+    return AsyncOpenAI(
         api_key=openai_config["api_key"],
         base_url=openai_config.get("base_url", "https://api.openai.com/v1")
     )
@@ -67,241 +127,808 @@ def get_claude_dir():
     return CLAUDE_DIR
 
 
-def read_history_file():
-    """读取主历史文件"""
-    history = []
-    if HISTORY_FILE.exists():
-        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    data = json.loads(line.strip())
-                    history.append(data)
-                except json.JSONDecodeError:
-                    continue
-    return history
+# 会话文件解析缓存：{(类别, 文件路径): {"mtime_ns", "size", "offset", "result"}}
+# 会话文件只追加写入，文件变化后从上次解析到的位置继续读取新增的行
+_session_cache = {}
+# 同一文件的增量解析需串行，不同文件可并行扫描
+_session_locks = {}
+
+
+def _cached_parse(path: Path, kind: str, init, update, parse=_loads):
+    """按(mtime, size)缓存JSONL文件的解析结果
+
+    init(previous=None) 创建初始结果（或复制已有结果），update(result, data) 将解析出的一行合并进结果
+    """
+    key = (kind, str(path))
+    with _session_locks.setdefault(key, threading.Lock()):
+        return _parse_incremental(path, key, init, update, parse)
+
+
+def _get_cached(path: Path, kind: str, st: Optional[os.stat_result] = None):
+    """返回已缓存且文件未变化的解析结果，否则返回None；st 为调用方已取得的文件状态"""
+    entry = _session_cache.get((kind, str(path)))
+    if entry is None:
+        return None
+    if st is None:
+        st = path.stat()
+    if entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+        return entry["result"]
+    return None
+
+
+# 剩余内容不超过该大小时整段读入内存，否则使用mmap
+_SMALL_READ_LIMIT = 1 << 20
+
+
+def _iter_lines(path: Path, offset: int = 0):
+    """从offset开始逐行返回文件内容（保留换行符）
+
+    小文件用一次read读入剩余内容；大文件通过mmap映射并用find查找换行符，
+    由内核按需换入页面，不经过文件缓冲层
+    """
+    with open(path, 'rb', buffering=0) as f:
+        fd = f.fileno()
+        size = os.fstat(fd).st_size
+        if size <= offset:
+            return
+        if size - offset <= _SMALL_READ_LIMIT:
+            # 会话文件大多只有几KB，一次系统调用读完比建立映射更省
+            # 用seek+read而非os.pread，后者在Windows上不可用
+            f.seek(offset)
+            buf = f.read(size - offset)
+            size = len(buf)
+            find = buf.find
+            pos = 0
+            while pos < size:
+                end = find(b"\n", pos)
+                end = size if end < 0 else end + 1
+                yield buf[pos:end]
+                pos = end
+            return
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+            # 顺序访问提示内核加大预读；调用方提前结束迭代时，未访问的尾部不会被读入
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            find = mm.find
+            pos = offset
+            while pos < size:
+                end = find(b"\n", pos)
+                end = size if end < 0 else end + 1
+                yield mm[pos:end]
+                pos = end
+
+
+def _iter_jsonl(path: Path, offset: int = 0, parse=_loads):
+    """从offset开始逐行解析JSONL文件，依次返回 (行起始位置, 行结束位置, 解析结果)
+
+    空行与无效行直接跳过；末尾尚未写完的行不返回，调用方下次从上一条记录的结束位置继续读取
+    """
+    for line in _iter_lines(path, offset):
+        start = offset
+        offset += len(line)
+        # 空行等不以{开头的行不可能是JSON对象，直接跳过，不进入异常处理
+        if line[:1] != b"{":
+            continue
+        try:
+            data = parse(line)
+        except json.JSONDecodeError:
+            if not line.endswith(b"\n"):
+                return
+            continue
+        yield start, offset, data
+
+
+def _parse_incremental(path: Path, key, init, update, parse):
+    st = path.stat()
+    entry = _session_cache.get(key)
+    if entry is not None and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+        return entry["result"]
+
+    if entry is None or st.st_size < entry["offset"]:
+        # 首次读取或文件被截断/重写时从头解析
+        offset, result = 0, init()
+    else:
+        # 在副本上追加，已返回给其他线程的结果保持不变
+        offset, result = entry["offset"], init(entry["result"])
+
+    for _, offset, data in _iter_jsonl(path, offset, parse):
+        update(result, data)
+
+    _session_cache[key] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "offset": offset, "result": result}
+    return result
+
+
+def _new_history_index(previous=None):
+    if previous is not None:
+        return {"offsets": list(previous["offsets"]), "slots": Counter(previous["slots"])}
+    return {"offsets": [], "slots": Counter()}
+
+
+def _write_json_atomic(path: Path, data):
+    """写入JSON缓存文件，先写临时文件再替换，读取方不会看到写了一半的内容"""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def _load_history_index(key):
+    """从sidecar文件恢复上次建立的历史索引"""
+    try:
+        with open(HISTORY_INDEX_FILE, 'rb') as f:
+            saved = _loads(f.read())
+        if saved["path"] != str(HISTORY_FILE):
+            return
+        _session_cache.setdefault(key, {
+            "mtime_ns": saved["mtime_ns"],
+            "size": saved["size"],
+            "offset": saved["offset"],
+            "result": {
+                "offsets": saved["offsets"],
+                "slots": Counter({int(slot): count for slot, count in saved["slots"].items()})
+            }
+        })
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        pass
+
+
+def _save_history_index(entry):
+    """将历史索引写入sidecar文件"""
+    saved = {
+        "path": str(HISTORY_FILE),
+        "mtime_ns": entry["mtime_ns"],
+        "size": entry["size"],
+        "offset": entry["offset"],
+        "offsets": entry["result"]["offsets"],
+        "slots": {str(slot): count for slot, count in entry["result"]["slots"].items()}
+    }
+    _write_json_atomic(HISTORY_INDEX_FILE, saved)
+
+
+def _history_index():
+    """history.jsonl的索引：每条有效记录的起始字节偏移，以及按15分钟时间片累计的记录数
+
+    分页与统计共用同一次扫描；文件只追加写入，只解析上次处理位置之后的新内容，索引持久化到sidecar文件
+    """
+    if not HISTORY_FILE.exists():
+        return _new_history_index()
+
+    key = ("history_index", str(HISTORY_FILE))
+    with _session_locks.setdefault(key, threading.Lock()):
+        if key not in _session_cache:
+            _load_history_index(key)
+
+        st = HISTORY_FILE.stat()
+        entry = _session_cache.get(key)
+        if entry is not None and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            return entry["result"]
+
+        if entry is None or st.st_size < entry["offset"]:
+            offset, index = 0, _new_history_index()
+        else:
+            offset, index = entry["offset"], _new_history_index(entry["result"])
+
+        append = index["offsets"].append
+        slots = index["slots"]
+        for start, offset, data in _iter_jsonl(HISTORY_FILE, offset):
+            append(start)
+            ts = data.get("timestamp")
+            if ts:
+                slots[int(ts) // 900_000] += 1
+
+        entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "offset": offset, "result": index}
+        _session_cache[key] = entry
+        _save_history_index(entry)
+        return index
+
+
+def read_history_page(offset: int, limit: int):
+    """按偏移分页读取历史记录，只解析请求范围内的行"""
+    offsets = _history_index()["offsets"]
+    offset = max(offset, 0)
+    count = min(max(limit, 0), len(offsets) - offset)
+    items = []
+
+    if count > 0:
+        records = _iter_jsonl(HISTORY_FILE, offsets[offset])
+        items = [data for _, _, data in itertools.islice(records, count)]
+
+    return {
+        "total": len(offsets),
+        "items": items
+    }
+
+
+def get_history_stats():
+    """获取历史记录的条数及时间片计数"""
+    index = _history_index()
+    return {"entries": len(index["offsets"]), "slots": index["slots"]}
+
+
+def _project_name(dir_name: str):
+    """将项目目录名转换回路径格式
+
+    Windows路径的目录名形如 C--Users-name（盘符后接--），其余按POSIX路径处理
+    """
+    if dir_name[:1].isalpha() and dir_name[1:3] == '--':
+        return dir_name.replace('--', ':\\').replace('-', '\\')
+    return dir_name.replace('--', '/').replace('-', '/')
+
+
+def _project_entries():
+    """列出所有项目目录，os.scandir 的条目自带文件类型，无需逐个stat"""
+    if not PROJECTS_DIR.exists():
+        return []
+    with os.scandir(PROJECTS_DIR) as entries:
+        return [entry for entry in entries if entry.is_dir()]
+
+
+def _is_session_entry(entry: os.DirEntry):
+    return entry.name.endswith(".jsonl") and entry.is_file()
+
+
+def _session_entries(project_path):
+    """列出项目目录下的所有会话文件"""
+    with os.scandir(project_path) as entries:
+        return [entry for entry in entries if _is_session_entry(entry)]
+
+
+def _count_sessions(project_path):
+    """统计项目目录下的会话文件数量，只计数不保留条目"""
+    with os.scandir(project_path) as entries:
+        return sum(1 for entry in entries if _is_session_entry(entry))
 
 
 def get_all_projects():
     """获取所有项目"""
     projects = []
-    if PROJECTS_DIR.exists():
-        for project_dir in PROJECTS_DIR.iterdir():
-            if project_dir.is_dir():
-                # 将目录名转换回路径格式
-                project_name = project_dir.name.replace('--', ':\\').replace('-', '\\')
-                if project_name.startswith('C:\\') or project_name.startswith('D:\\'):
-                    pass
-                else:
-                    project_name = project_dir.name.replace('--', '/').replace('-', '/')
-
-                # 统计会话数量
-                session_count = len(list(project_dir.glob("*.jsonl")))
-                projects.append({
-                    "id": project_dir.name,
-                    "name": project_name,
-                    "path": str(project_dir),
-                    "session_count": session_count
-                })
+    for project_entry in _project_entries():
+        project_name = _project_name(project_entry.name)
+
+        # 统计会话数量
+        session_count = _count_sessions(project_entry.path)
+        projects.append({
+            "id": project_entry.name,
+            "name": project_name,
+            "path": project_entry.path,
+            "session_count": session_count
+        })
     return sorted(projects, key=lambda x: x["session_count"], reverse=True)
 
 
+def _new_session_stats(previous=None):
+    if previous is not None:
+        return {
+            **previous,
+            "model_usage": Counter(previous["model_usage"]),
+            "tool_usage": Counter(previous["tool_usage"])
+        }
+    return {
+        "message_count": 0,
+        "first_timestamp": None,
+        "last_timestamp": None,
+        "model_usage": Counter(),
+        "tool_usage": Counter()
+    }
+
+
+def _update_session_stats(session_stats, data):
+    """累计会话的消息数、首末时间戳、模型与工具使用次数"""
+    if data.get("type") in ("user", "assistant"):
+        session_stats["message_count"] += 1
+        ts = data.get("timestamp")
+        if ts:
+            if session_stats["first_timestamp"] is None:
+                session_stats["first_timestamp"] = ts
+            session_stats["last_timestamp"] = ts
+
+    # 统计模型使用
+    msg = data.get("message", {})
+    if isinstance(msg, dict):
+        model = msg.get("model")
+        if model:
+            session_stats["model_usage"][model] += 1
+
+        # 统计工具使用：Counter.update 在C层完成计数
+        content = msg.get("content", [])
+        if isinstance(content, list):
+            session_stats["tool_usage"].update(
+                item.get("name", "unknown")
+                for item in content
+                if isinstance(item, dict) and item.get("type") == "tool_use"
+            )
+
+
+if msgspec is not None:
+    class _StatsContentItem(msgspec.Struct):
+        type: Any = None
+        name: Any = "unknown"
+
+    class _StatsMessage(msgspec.Struct):
+        model: Any = None
+        content: Union[str, List[Union[str, _StatsContentItem]], None] = None
+
+    class _StatsLine(msgspec.Struct):
+        type: Any = None
+        timestamp: Any = None
+        message: Optional[_StatsMessage] = None
+
+    _stats_decoder = msgspec.json.Decoder(_StatsLine)
+
+
+def _parse_stats_line(line: bytes):
+    """解析会话文件中的一行，只保留统计需要的字段"""
+    if msgspec is None:
+        return _loads(line)
+
+    try:
+        entry = _stats_decoder.decode(line)
+    except (msgspec.DecodeError, msgspec.ValidationError):
+        # 结构不符合声明时回退到完整解析，无效JSON由_loads抛出JSONDecodeError
+        return _loads(line)
+
+    message = entry.message
+    if message is not None:
+        content = message.content
+        if isinstance(content, list):
+            content = [
+                item if isinstance(item, str) else {"type": item.type, "name": item.name}
+                for item in content
+            ]
+        message = {"model": message.model, "content": content}
+
+    return {"type": entry.type, "timestamp": entry.timestamp, "message": message}
+
+
+def _scan_session(session_file: Path):
+    """扫描会话文件，会话列表与统计信息共用同一份缓存结果"""
+    return _cached_parse(session_file, "stats", _new_session_stats, _update_session_stats, _parse_stats_line)
+
+
+# 已从sidecar恢复过的项目目录
+_loaded_session_indexes = set()
+
+
+def _session_index_path(project_dir: Path):
+    return SESSION_INDEX_DIR / f"{project_dir.name}.json"
+
+
+def _load_session_index(project_dir: Path):
+    """从sidecar索引恢复项目下各会话的扫描结果，重启后未变化的会话无需重新解析"""
+    if project_dir in _loaded_session_indexes:
+        return
+    _loaded_session_indexes.add(project_dir)
+
+    try:
+        with open(_session_index_path(project_dir), 'rb') as f:
+            index = _loads(f.read())
+        if index["path"] != str(project_dir):
+            return
+        for name, saved in index["sessions"].items():
+            _session_cache.setdefault(("stats", str(project_dir / name)), {
+                "mtime_ns": saved["mtime_ns"],
+                "size": saved["size"],
+                "offset": saved["offset"],
+                "result": {
+                    "message_count": saved["message_count"],
+                    "first_timestamp": saved["first_timestamp"],
+                    "last_timestamp": saved["last_timestamp"],
+                    "model_usage": Counter(saved["model_usage"]),
+                    "tool_usage": Counter(saved["tool_usage"])
+                }
+            })
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        pass
+
+
+def _save_session_index(project_dir: Path, session_files):
+    """将项目下各会话的扫描结果写入sidecar索引，已删除的会话随之移除"""
+    sessions = {}
+    for session_file in session_files:
+        entry = _session_cache.get(("stats", str(session_file)))
+        if entry is None:
+            continue
+        result = entry["result"]
+        sessions[session_file.name] = {
+            "mtime_ns": entry["mtime_ns"],
+            "size": entry["size"],
+            "offset": entry["offset"],
+            "message_count": result["message_count"],
+            "first_timestamp": result["first_timestamp"],
+            "last_timestamp": result["last_timestamp"],
+            "model_usage": dict(result["model_usage"]),
+            "tool_usage": dict(result["tool_usage"])
+        }
+    _write_json_atomic(_session_index_path(project_dir), {"path": str(project_dir), "sessions": sessions})
+
+
+def _invalidate_sessions(project_dir: Path, session_file: Optional[Path] = None):
+    """删除会话或项目后清理对应的缓存与sidecar索引"""
+    prefix = str(session_file) if session_file else str(project_dir) + os.sep
+    # 其他线程可能同时写入缓存，遍历快照而非字典本身
+    for key in list(_session_cache):
+        if key[1] == prefix or key[1].startswith(prefix):
+            _session_cache.pop(key, None)
+
+    if session_file is None:
+        _loaded_session_indexes.discard(project_dir)
+        try:
+            _session_index_path(project_dir).unlink()
+        except OSError:
+            pass
+    elif project_dir.exists():
+        _save_session_index(project_dir, [Path(entry.path) for entry in _session_entries(project_dir)])
+
+
+def _scan_sessions(session_entries):
+    """使用线程池并行扫描多个会话文件（os.scandir 的条目），返回 {文件路径: 扫描结果}"""
+    session_files = [Path(entry.path) for entry in session_entries]
+    for project_dir in {f.parent for f in session_files}:
+        _load_session_index(project_dir)
+
+    scanned = {}
+    pending = []
+    for session_file, entry in zip(session_files, session_entries):
+        # 复用目录条目缓存的stat结果判断会话是否变化
+        cached = _get_cached(session_file, "stats", entry.stat())
+        if cached is None:
+            pending.append(session_file)
+        else:
+            scanned[session_file] = cached
+
+    # 只有需要解析的文件才交给线程池
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+            scanned.update(zip(pending, executor.map(_scan_session, pending)))
+
+        # 有会话重新解析过的项目更新其sidecar索引
+        for project_dir in {f.parent for f in pending}:
+            _save_session_index(project_dir, [f for f in session_files if f.parent == project_dir])
+    return {f: scanned[f] for f in session_files}
+
+
 def get_project_sessions(project_id: str):
     """获取项目的所有会话"""
     project_dir = PROJECTS_DIR / project_id
     sessions = []
 
     if project_dir.exists():
-        for session_file in project_dir.glob("*.jsonl"):
-            session_id = session_file.stem
-            # 读取会话文件获取基本信息
-            messages = []
-            first_timestamp = None
-            last_timestamp = None
-            message_count = 0
-
-            with open(session_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        data = json.loads(line.strip())
-                        if data.get("type") in ["user", "assistant"]:
-                            message_count += 1
-                            ts = data.get("timestamp")
-                            if ts:
-                                if first_timestamp is None:
-                                    first_timestamp = ts
-                                last_timestamp = ts
-                    except json.JSONDecodeError:
-                        continue
-
+        # 读取会话文件获取基本信息
+        scanned = _scan_sessions(_session_entries(project_dir))
+        for session_file, session_stats in scanned.items():
             sessions.append({
-                "id": session_id,
+                "id": session_file.stem,
                 "file": str(session_file),
-                "message_count": message_count,
-                "first_timestamp": first_timestamp,
-                "last_timestamp": last_timestamp
+                "message_count": session_stats["message_count"],
+                "first_timestamp": session_stats["first_timestamp"],
+                "last_timestamp": session_stats["last_timestamp"]
             })
 
-    return sorted(sessions, key=lambda x: x.get("last_timestamp") or "", reverse=True)
+    sessions.sort(key=lambda x: x["last_timestamp"] or "", reverse=True)
+    return sessions
+
+
+def _parse_message_line(line: bytes):
+    """解析会话文件中的一行，只导出消息展示需要的字段"""
+    # 完整的行中不含"user"/"assistant"时不可能是消息，无需解析
+    if line.endswith(b"\n") and b'"user"' not in line and b'"assistant"' not in line:
+        return {}
+
+    if simdjson is None:
+        return _loads(line)
+
+    parser = getattr(_simd_local, "parser", None)
+    if parser is None:
+        parser = _simd_local.parser = simdjson.Parser()
+    try:
+        doc = parser.parse(line)
+    except (RuntimeError, ValueError):
+        return _loads(line)
+    if not isinstance(doc, simdjson.Object):
+        return _loads(line)
+
+    msg_type = doc.get("type")
+    if msg_type not in ("user", "assistant"):
+        return {"type": msg_type}
+
+    message = doc.get("message", {})
+    if isinstance(message, simdjson.Object):
+        content = message.get("content", "")
+        # 只有content为列表时才需要完整导出
+        if isinstance(content, simdjson.Array):
+            content = content.as_list()
+        elif isinstance(content, simdjson.Object):
+            content = content.as_dict()
+        message = {
+            "content": content,
+            "model": message.get("model", "")
+        }
+
+    return {
+        "type": msg_type,
+        "message": message,
+        "timestamp": doc.get("timestamp"),
+        "uuid": doc.get("uuid"),
+        "cwd": doc.get("cwd", "")
+    }
+
+
+# 展示文本中各类条目的前缀
+THINKING_PREFIX = "💭 思考过程:\n"
+TOOL_RESULT_PREFIX = "📋 工具结果:\n"
+# 工具结果超过该长度时截断
+TOOL_RESULT_LIMIT = 500
+
+
+def _append_text(item, text_parts):
+    text = item.get("text", "")
+    if text:
+        text_parts.append(text)
+
+
+def _append_thinking(item, text_parts):
+    thinking_text = item.get("thinking", "")
+    if thinking_text:
+        text_parts.append(THINKING_PREFIX + thinking_text)
+
+
+# 工具调用描述依次取用的输入字段及截断长度
+_TOOL_FIELDS = (("command", 100), ("file_path", None), ("pattern", None))
+
+
+def _append_tool_use(item, text_parts):
+    tool_name = item.get("name", "unknown")
+    tool_input = item.get("input", {})
+    tool_desc = ""
+    if isinstance(tool_input, dict):
+        for field, limit in _TOOL_FIELDS:
+            if field in tool_input:
+                value = tool_input[field]
+                tool_desc = f": {value[:limit] if limit else value}"
+                break
+    text_parts.append(f"🔧 [{tool_name}{tool_desc}]")
+
+
+def _append_tool_result(item, text_parts):
+    result_content = item.get("content", "")
+    if result_content:
+        # 截断过长的工具结果
+        if len(result_content) > TOOL_RESULT_LIMIT:
+            result_content = result_content[:TOOL_RESULT_LIMIT] + "..."
+        text_parts.append(f"{TOOL_RESULT_PREFIX}{result_content}")
+
+
+# content列表中各类条目的处理函数
+_ITEM_HANDLERS = {
+    "text": _append_text,
+    "thinking": _append_thinking,
+    "tool_use": _append_tool_use,
+    "tool_result": _append_tool_result
+}
+
+
+def _flatten_content(content: list):
+    """将content列表中的各条目转换为展示文本并拼接"""
+    text_parts = []
+    append = text_parts.append
+    get_handler = _ITEM_HANDLERS.get
+    # JSON解析结果只含内置类型，直接比较类型即可，省去isinstance的子类检查
+    for item in content:
+        item_type = type(item)
+        if item_type is dict:
+            handler = get_handler(item.get("type", ""))
+            if handler:
+                handler(item, text_parts)
+        elif item_type is str and item:
+            append(item)
+    # 各处理函数只追加非空文本，无需再过滤
+    return "\n".join(text_parts)
+
+
+def _message_content(data):
+    """返回会话文件中一行对应的 (message字段, 展示文本)，不是消息或内容为空时返回None"""
+    if data.get("type") not in ("user", "assistant"):
+        return None
+
+    # 每个字段只查找一次
+    message = data.get("message")
+    if not isinstance(message, dict):
+        message = {}
+    content = message.get("content", "")
+
+    # 处理content可能是列表的情况
+    if isinstance(content, list):
+        content = _flatten_content(content)
+
+    # 跳过空消息
+    if not content or not content.strip():
+        return None
+    return message, content
 
 
-def get_session_messages(project_id: str, session_id: str):
-    """获取会话的所有消息"""
+def _append_message(messages, data):
+    """将会话文件中的一行转换为展示用的消息"""
+    parsed = _message_content(data)
+    if parsed is None:
+        return
+    message, content = parsed
+
+    messages.append({
+        "type": data["type"],
+        "content": content,
+        "timestamp": data.get("timestamp"),
+        "uuid": data.get("uuid"),
+        "cwd": data.get("cwd", ""),
+        "model": message.get("model", "")
+    })
+
+
+def get_session_messages(project_id: str, session_id: str, *,
+                         max_messages: Optional[int] = None, max_content_len: Optional[int] = None):
+    """获取会话的消息
+
+    max_messages 限制返回的消息条数，会话尚未缓存时只解析到所需条数为止；
+    max_content_len 截断每条消息的内容
+    """
     session_file = PROJECTS_DIR / project_id / f"{session_id}.jsonl"
-    messages = []
 
-    if session_file.exists():
-        with open(session_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    data = json.loads(line.strip())
-                    msg_type = data.get("type")
-                    if msg_type in ["user", "assistant"]:
-                        message = data.get("message", {})
-                        content = message.get("content", "")
-
-                        # 处理content可能是列表的情况
-                        if isinstance(content, list):
-                            text_parts = []
-                            for item in content:
-                                if isinstance(item, dict):
-                                    item_type = item.get("type", "")
-                                    if item_type == "text":
-                                        text_parts.append(item.get("text", ""))
-                                    elif item_type == "thinking":
-                                        thinking_text = item.get("thinking", "")
-                                        if thinking_text:
-                                            text_parts.append(f"💭 思考过程:\n{thinking_text}")
-                                    elif item_type == "tool_use":
-                                        tool_name = item.get("name", "unknown")
-                                        tool_input = item.get("input", {})
-                                        tool_desc = ""
-                                        if isinstance(tool_input, dict):
-                                            if "command" in tool_input:
-                                                tool_desc = f": {tool_input.get('command', '')[:100]}"
-                                            elif "file_path" in tool_input:
-                                                tool_desc = f": {tool_input.get('file_path', '')}"
-                                            elif "pattern" in tool_input:
-                                                tool_desc = f": {tool_input.get('pattern', '')}"
-                                        text_parts.append(f"🔧 [{tool_name}{tool_desc}]")
-                                    elif item_type == "tool_result":
-                                        result_content = item.get("content", "")
-                                        if result_content:
-                                            # 截断过长的工具结果
-                                            if len(result_content) > 500:
-                                                result_content = result_content[:500] + "..."
-                                            text_parts.append(f"📋 工具结果:\n{result_content}")
-                                elif isinstance(item, str):
-                                    text_parts.append(item)
-                            content = "\n".join(filter(None, text_parts))
-
-                        # 如果content仍然为空，尝试从其他字段获取
-                        if not content and isinstance(message, dict):
-                            # 尝试获取role为user时的直接content
-                            if message.get("role") == "user" and isinstance(message.get("content"), str):
-                                content = message.get("content", "")
-
-                        # 跳过空消息
-                        if not content or not content.strip():
-                            continue
-
-                        messages.append({
-                            "type": msg_type,
-                            "content": content,
-                            "timestamp": data.get("timestamp"),
-                            "uuid": data.get("uuid"),
-                            "cwd": data.get("cwd", ""),
-                            "model": message.get("model", "") if isinstance(message, dict) else ""
-                        })
-                except json.JSONDecodeError:
-                    continue
+    if not session_file.exists():
+        return []
 
+    if max_messages is None:
+        messages = list(_cached_parse(session_file, "messages", list, _append_message, _parse_message_line))
+    else:
+        messages = _get_cached(session_file, "messages")
+        if messages is None:
+            messages = []
+            for _, _, data in _iter_jsonl(session_file, parse=_parse_message_line):
+                _append_message(messages, data)
+                if len(messages) >= max_messages:
+                    break
+        messages = messages[:max_messages]
+
+    if max_content_len is not None:
+        messages = [{**msg, "content": msg["content"][:max_content_len]} for msg in messages]
     return messages
 
 
-def get_statistics():
-    """获取统计信息"""
+def count_session_messages(project_id: str, session_id: str):
+    """统计会话的消息数，与 get_session_messages 的结果条数一致，但不保留消息内容"""
+    session_file = PROJECTS_DIR / project_id / f"{session_id}.jsonl"
+
+    if not session_file.exists():
+        return 0
+
+    messages = _get_cached(session_file, "messages")
+    if messages is not None:
+        return len(messages)
+    return sum(
+        1 for _, _, data in _iter_jsonl(session_file, parse=_parse_message_line)
+        if _message_content(data) is not None
+    )
+
+
+# 历史活跃度缓存：(时间片计数, 每日活跃度, 每小时活跃度)，历史索引未变化时直接复用
+_activity_cache = {"entry": (None, None, None)}
+
+
+def _history_activity(slots):
+    """将15分钟时间片计数换算为最近30天的每日活跃度及各小时活跃度
+
+    各时区偏移均为15分钟的整数倍，同一时间片内的本地日期与小时相同，每个时间片只换算一次
+    """
+    cached_slots, daily, hourly = _activity_cache["entry"]
+    if cached_slots is slots:
+        return daily, hourly
+
+    daily = defaultdict(int)
+    hourly = defaultdict(int)
+    fromtimestamp = datetime.fromtimestamp
+    for slot, count in slots.items():
+        dt = fromtimestamp(slot * 900)
+        daily[dt.date().isoformat()] += count
+        hourly[dt.hour] += count
+
+    daily = dict(sorted(daily.items())[-30:])
+    hourly = dict(sorted(hourly.items()))
+    _activity_cache["entry"] = (slots, daily, hourly)
+    return daily, hourly
+
+
+# 统计结果缓存：(数据指纹, 统计结果)，指纹不变时直接复用
+_stats_cache = {"entry": (None, None)}
+
+
+def get_statistics(fingerprint: Optional[str] = None):
+    """获取统计信息
+
+    fingerprint 为 get_data_etag() 的结果，调用方已计算过时可直接传入，避免重复遍历目录
+    """
+    if fingerprint is None:
+        fingerprint = get_data_etag()
+    cached_fingerprint, cached_stats = _stats_cache["entry"]
+    if cached_fingerprint == fingerprint:
+        return cached_stats
+
     stats = {
         "total_projects": 0,
         "total_sessions": 0,
         "total_messages": 0,
         "projects_by_activity": [],
-        "daily_activity": defaultdict(int),
-        "hourly_activity": defaultdict(int),
-        "model_usage": defaultdict(int),
-        "tool_usage": defaultdict(int)
+        "daily_activity": {},
+        "hourly_activity": {},
+        "model_usage": Counter(),
+        "tool_usage": Counter()
     }
 
-    history = read_history_file()
-    stats["total_history_entries"] = len(history)
+    history_stats = get_history_stats()
+    stats["total_history_entries"] = history_stats["entries"]
 
     # 分析历史记录
-    for entry in history:
-        ts = entry.get("timestamp")
-        if ts:
-            dt = datetime.fromtimestamp(ts / 1000)
-            date_str = dt.strftime("%Y-%m-%d")
-            hour = dt.hour
-            stats["daily_activity"][date_str] += 1
-            stats["hourly_activity"][hour] += 1
+    stats["daily_activity"], stats["hourly_activity"] = _history_activity(history_stats["slots"])
+
+    # 统计项目：一次遍历同时得到项目数、会话数及各会话文件
+    project_sessions = [
+        (project_entry.name, _session_entries(project_entry.path))
+        for project_entry in _project_entries()
+    ]
+    stats["total_projects"] = len(project_sessions)
 
-    # 统计项目
-    projects = get_all_projects()
-    stats["total_projects"] = len(projects)
+    # 各会话文件相互独立，使用线程池并行扫描
+    scanned = _scan_sessions([entry for _, entries in project_sessions for entry in entries])
 
-    for project in projects:
-        project_dir = PROJECTS_DIR / project["id"]
-        session_files = list(project_dir.glob("*.jsonl"))
-        stats["total_sessions"] += len(session_files)
+    for project_id, entries in project_sessions:
+        stats["total_sessions"] += len(entries)
 
         project_messages = 0
-        for session_file in session_files:
-            with open(session_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        data = json.loads(line.strip())
-                        if data.get("type") in ["user", "assistant"]:
-                            project_messages += 1
-                            stats["total_messages"] += 1
-
-                        # 统计模型使用
-                        msg = data.get("message", {})
-                        if isinstance(msg, dict):
-                            model = msg.get("model")
-                            if model:
-                                stats["model_usage"][model] += 1
-
-                            # 统计工具使用
-                            content = msg.get("content", [])
-                            if isinstance(content, list):
-                                for item in content:
-                                    if isinstance(item, dict) and item.get("type") == "tool_use":
-                                        tool_name = item.get("name", "unknown")
-                                        stats["tool_usage"][tool_name] += 1
-                    except json.JSONDecodeError:
-                        continue
+        for entry in entries:
+            session_stats = scanned[Path(entry.path)]
+            project_messages += session_stats["message_count"]
+            stats["model_usage"].update(session_stats["model_usage"])
+            stats["tool_usage"].update(session_stats["tool_usage"])
+        stats["total_messages"] += project_messages
 
         stats["projects_by_activity"].append({
-            "name": project["name"],
-            "id": project["id"],
+            "name": _project_name(project_id),
+            "id": project_id,
             "messages": project_messages
         })
 
-    # 排序
-    stats["projects_by_activity"] = sorted(
-        stats["projects_by_activity"],
-        key=lambda x: x["messages"],
-        reverse=True
-    )[:10]
+    # 排序：只需前N项，heapq.nlargest 与完整排序后截取的结果一致
+    stats["projects_by_activity"] = heapq.nlargest(10, stats["projects_by_activity"], key=itemgetter("messages"))
 
-    # 转换defaultdict为普通dict
-    stats["daily_activity"] = dict(sorted(stats["daily_activity"].items())[-30:])
-    stats["hourly_activity"] = dict(sorted(stats["hourly_activity"].items()))
+    # 转换Counter为普通dict
     stats["model_usage"] = dict(stats["model_usage"])
-    stats["tool_usage"] = dict(sorted(stats["tool_usage"].items(), key=lambda x: x[1], reverse=True)[:20])
+    stats["tool_usage"] = dict(stats["tool_usage"].most_common(20))
 
+    _stats_cache["entry"] = (fingerprint, stats)
     return stats
 
 
+def get_data_etag():
+    """根据历史文件与各会话文件的(名称, mtime, size)计算ETag"""
+    digest = hashlib.blake2b(digest_size=16)
+    if HISTORY_FILE.exists():
+        st = HISTORY_FILE.stat()
+        digest.update(f"history:{st.st_mtime_ns}:{st.st_size}\n".encode())
+
+    for project_entry in _project_entries():
+        digest.update(f"project:{project_entry.name}\n".encode())
+        for entry in _session_entries(project_entry.path):
+            st = entry.stat()
+            digest.update(f"{entry.name}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+
+    return f'"{digest.hexdigest()}"'
+
+
+def _cache_headers(etag: str):
+    return {"ETag": etag, "Cache-Control": "max-age=0, must-revalidate"}
+
+
 # API路由
 @app.get("/")
 async def root():
@@ -310,23 +937,29 @@ async def root():
 
 
 @app.get("/api/projects")
-async def api_projects():
+async def api_projects(request: Request, response: Response):
     """获取所有项目列表"""
-    return get_all_projects()
+    etag = await asyncio.to_thread(get_data_etag)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=_cache_headers(etag))
+
+    response.headers.update(_cache_headers(etag))
+    return await asyncio.to_thread(get_all_projects)
 
 
 @app.get("/api/projects/{project_id}/sessions")
 async def api_project_sessions(project_id: str):
     """获取项目的会话列表"""
-    return get_project_sessions(project_id)
+    return await asyncio.to_thread(get_project_sessions, project_id)
 
 
 @app.get("/api/projects/{project_id}/sessions/{session_id}")
 async def api_session_messages(project_id: str, session_id: str):
     """获取会话的消息列表"""
     session_file = PROJECTS_DIR / project_id / f"{session_id}.jsonl"
+    messages = await asyncio.to_thread(get_session_messages, project_id, session_id)
     return {
-        "messages": get_session_messages(project_id, session_id),
+        "messages": messages,
         "source_file": str(session_file) if session_file.exists() else None,
         "project_id": project_id,
         "session_id": session_id
@@ -334,24 +967,24 @@ async def api_session_messages(project_id: str, session_id: str):
 
 
 @app.get("/api/statistics")
-async def api_statistics():
+async def api_statistics(request: Request, response: Response):
     """获取统计信息"""
-    return get_statistics()
+    etag = await asyncio.to_thread(get_data_etag)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=_cache_headers(etag))
+
+    response.headers.update(_cache_headers(etag))
+    return await asyncio.to_thread(get_statistics, etag)
 
 
 @app.get("/api/history")
 async def api_history(limit: int = 100, offset: int = 0):
     """获取历史记录"""
-    history = read_history_file()
-    return {
-        "total": len(history),
-        "items": history[offset:offset + limit]
-    }
+    return await asyncio.to_thread(read_history_page, offset, limit)
 
 
-@app.delete("/api/projects/{project_id}/sessions/{session_id}")
-async def api_delete_session(project_id: str, session_id: str):
-    """删除会话"""
+def delete_session(project_id: str, session_id: str):
+    """删除会话文件及会话目录，返回 (已删除的路径, 错误信息)"""
     session_file = PROJECTS_DIR / project_id / f"{session_id}.jsonl"
     session_dir = PROJECTS_DIR / project_id / session_id
 
@@ -365,6 +998,8 @@ async def api_delete_session(project_id: str, session_id: str):
             deleted_files.append(str(session_file))
         except Exception as e:
             errors.append(f"删除文件失败: {str(e)}")
+        else:
+            _invalidate_sessions(session_file.parent, session_file)
 
     # 删除会话目录（如果存在）
     if session_dir.exists() and session_dir.is_dir():
@@ -374,6 +1009,20 @@ async def api_delete_session(project_id: str, session_id: str):
         except Exception as e:
             errors.append(f"删除目录失败: {str(e)}")
 
+    return deleted_files, errors
+
+
+def delete_project(project_dir: Path):
+    """删除整个项目目录"""
+    shutil.rmtree(project_dir)
+    _invalidate_sessions(project_dir)
+
+
+@app.delete("/api/projects/{project_id}/sessions/{session_id}")
+async def api_delete_session(project_id: str, session_id: str):
+    """删除会话"""
+    deleted_files, errors = await asyncio.to_thread(delete_session, project_id, session_id)
+
     if not deleted_files and not errors:
         raise HTTPException(status_code=404, detail="会话不存在")
 
@@ -393,7 +1042,7 @@ async def api_delete_project(project_id: str):
         raise HTTPException(status_code=404, detail="项目不存在")
 
     try:
-        shutil.rmtree(project_dir)
+        await asyncio.to_thread(delete_project, project_dir)
         return {
             "success": True,
             "deleted": str(project_dir)
@@ -493,6 +1142,85 @@ ANALYSIS_PROMPT = """你是一个专业的用户行为分析师，专门分析
 """
 
 
+def _analysis_cache_path(model: str, conversation_text: str):
+    """分析结果缓存文件路径，以模型与完整提示内容的哈希为键"""
+    digest = hashlib.blake2b(f"{model}\n{ANALYSIS_PROMPT}{conversation_text}".encode(), digest_size=16)
+    return ANALYSIS_CACHE_DIR / f"{digest.hexdigest()}.json"
+
+
+def _load_cached_analysis(cache_path: Path):
+    try:
+        with open(cache_path, 'rb') as f:
+            return _loads(f.read())["result"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+async def _cached_chunks(analysis_result: str):
+    yield analysis_result
+
+
+async def _completion_chunks(stream, cache_path: Path):
+    """逐段产出模型生成的内容，生成完毕后写入分析结果缓存"""
+    parts = []
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+            yield delta
+    if parts:
+        await asyncio.to_thread(_write_json_atomic, cache_path, {"result": "".join(parts)})
+
+
+async def start_analysis(client, model: str, conversation_text: str):
+    """开始AI分析，返回逐段产出分析结果的异步迭代器；相同模型与对话内容的分析结果直接取缓存
+
+    模型请求在返回前发出，连接或鉴权失败时由调用方在开始响应前处理
+    """
+    cache_path = _analysis_cache_path(model, conversation_text)
+    analysis_result = await asyncio.to_thread(_load_cached_analysis, cache_path)
+    if analysis_result is not None:
+        return _cached_chunks(analysis_result)
+
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": "你是一个专业的用户行为分析师，擅长从对话中提取用户偏好。请用中文回复。"},
+            {"role": "user", "content": ANALYSIS_PROMPT + conversation_text}
+        ],
+        max_tokens=4000,
+        stream=True
+    )
+    return _completion_chunks(stream, cache_path)
+
+
+async def _stream_report(chunks, report_filename: str, header: str):
+    """将分析结果逐段返回给客户端，全部返回后保存报告"""
+    parts = []
+    async for delta in chunks:
+        parts.append(delta)
+        yield delta
+    await asyncio.to_thread(write_report, report_filename, header, "".join(parts))
+
+
+def report_response(chunks, report_filename: str, header: str):
+    """以流式响应返回分析报告，报告文件名通过响应头告知客户端"""
+    return StreamingResponse(
+        _stream_report(chunks, report_filename, header),
+        media_type="text/markdown; charset=utf-8",
+        headers={"X-Report-File": quote(report_filename)}
+    )
+
+
+def write_report(report_filename: str, header: str, analysis_result: str):
+    """保存分析报告"""
+    REPORTS_DIR.mkdir(exist_ok=True)
+    with open(REPORTS_DIR / report_filename, 'w', encoding='utf-8') as f:
+        f.write(header)
+        f.write("---\n\n")
+        f.write(analysis_result)
+
+
 @app.post("/api/analyze/{project_id}/sessions/{session_id}")
 async def api_analyze_session(project_id: str, session_id: str):
     """分析单个会话"""
@@ -500,15 +1228,19 @@ async def api_analyze_session(project_id: str, session_id: str):
     if not client:
         raise HTTPException(status_code=400, detail="请先配置OpenAI API密钥")
 
-    messages = get_session_messages(project_id, session_id)
+    # 限制消息数量避免超长；报告中的消息数量单独统计，不保留全部消息内容
+    messages = await asyncio.to_thread(
+        get_session_messages, project_id, session_id, max_messages=100, max_content_len=1000
+    )
     if not messages:
         raise HTTPException(status_code=404, detail="会话不存在或没有消息")
+    message_count = await asyncio.to_thread(count_session_messages, project_id, session_id)
 
     # 构建对话内容
     conversation = []
-    for msg in messages[:100]:  # 限制消息数量避免超长
+    for msg in messages:
         role = "用户" if msg["type"] == "user" else "AI助手"
-        content = msg["content"][:1000]  # 截断过长内容
+        content = msg["content"]
         conversation.append(f"**{role}**: {content}")
 
     conversation_text = "\n\n".join(conversation)
@@ -518,40 +1250,21 @@ async def api_analyze_session(project_id: str, session_id: str):
     model = config.get("openai", {}).get("model", "gpt-4o-mini")
 
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "你是一个专业的用户行为分析师，擅长从对话中提取用户偏好。请用中文回复。"},
-                {"role": "user", "content": ANALYSIS_PROMPT + conversation_text}
-            ],
-            max_tokens=4000
-        )
-
-        analysis_result = response.choices[0].message.content
-
-        # 保存报告
-        REPORTS_DIR.mkdir(exist_ok=True)
-        report_filename = f"{project_id}_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
-        report_path = REPORTS_DIR / report_filename
-
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write(f"# 会话分析报告\n\n")
-            f.write(f"- **项目**: {project_id}\n")
-            f.write(f"- **会话**: {session_id}\n")
-            f.write(f"- **分析时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"- **消息数量**: {len(messages)}\n\n")
-            f.write("---\n\n")
-            f.write(analysis_result)
-
-        return {
-            "success": True,
-            "report": analysis_result,
-            "report_file": report_filename
-        }
-
+        chunks = await start_analysis(client, model, conversation_text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"分析失败: {str(e)}")
 
+    # 生成结束后保存报告
+    report_filename = f"{project_id}_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
+    header = (
+        f"# 会话分析报告\n\n"
+        f"- **项目**: {project_id}\n"
+        f"- **会话**: {session_id}\n"
+        f"- **分析时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"- **消息数量**: {message_count}\n\n"
+    )
+    return report_response(chunks, report_filename, header)
+
 
 @app.post("/api/analyze/{project_id}")
 async def api_analyze_project(project_id: str):
@@ -560,15 +1273,19 @@ async def api_analyze_project(project_id: str):
     if not client:
         raise HTTPException(status_code=400, detail="请先配置OpenAI API密钥")
 
-    sessions = get_project_sessions(project_id)
+    sessions = await asyncio.to_thread(get_project_sessions, project_id)
     if not sessions:
         raise HTTPException(status_code=404, detail="项目不存在或没有会话")
 
-    # 收集所有会话的消息
+    # 收集所有会话的消息，各会话并行读取
+    session_messages = await asyncio.gather(*[
+        # 每个会话取前20条
+        asyncio.to_thread(get_session_messages, project_id, session["id"], max_messages=20, max_content_len=500)
+        for session in sessions[:10]  # 限制会话数量
+    ])
     all_messages = []
-    for session in sessions[:10]:  # 限制会话数量
-        messages = get_session_messages(project_id, session["id"])
-        all_messages.extend(messages[:20])  # 每个会话取前20条
+    for messages in session_messages:
+        all_messages.extend(messages)
 
     if not all_messages:
         raise HTTPException(status_code=404, detail="没有找到消息")
@@ -577,7 +1294,7 @@ async def api_analyze_project(project_id: str):
     conversation = []
     for msg in all_messages[:200]:  # 总共限制200条
         role = "用户" if msg["type"] == "user" else "AI助手"
-        content = msg["content"][:500]
+        content = msg["content"]
         conversation.append(f"**{role}**: {content}")
 
     conversation_text = "\n\n".join(conversation)
@@ -587,54 +1304,59 @@ async def api_analyze_project(project_id: str):
     model = config.get("openai", {}).get("model", "gpt-4o-mini")
 
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "你是一个专业的用户行为分析师，擅长从对话中提取用户偏好。请用中文回复。"},
-                {"role": "user", "content": ANALYSIS_PROMPT + conversation_text}
-            ],
-            max_tokens=4000
-        )
-
-        analysis_result = response.choices[0].message.content
-
-        # 保存报告
-        REPORTS_DIR.mkdir(exist_ok=True)
-        report_filename = f"{project_id}_full_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
-        report_path = REPORTS_DIR / report_filename
-
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write(f"# 项目分析报告\n\n")
-            f.write(f"- **项目**: {project_id}\n")
-            f.write(f"- **分析时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"- **会话数量**: {len(sessions)}\n")
-            f.write(f"- **分析消息数**: {len(all_messages)}\n\n")
-            f.write("---\n\n")
-            f.write(analysis_result)
-
-        return {
-            "success": True,
-            "report": analysis_result,
-            "report_file": report_filename
-        }
-
+        chunks = await start_analysis(client, model, conversation_text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"分析失败: {str(e)}")
 
+    # 生成结束后保存报告
+    report_filename = f"{project_id}_full_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
+    header = (
+        f"# 项目分析报告\n\n"
+        f"- **项目**: {project_id}\n"
+        f"- **分析时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"- **会话数量**: {len(sessions)}\n"
+        f"- **分析消息数**: {len(all_messages)}\n\n"
+    )
+    return report_response(chunks, report_filename, header)
 
-@app.get("/api/reports")
-async def api_list_reports():
+
+def list_reports():
     """获取所有分析报告列表"""
     REPORTS_DIR.mkdir(exist_ok=True)
     reports = []
-    for report_file in REPORTS_DIR.glob("*.md"):
-        stat = report_file.stat()
-        reports.append({
-            "filename": report_file.name,
-            "size": stat.st_size,
-            "created": datetime.fromtimestamp(stat.st_mtime).isoformat()
-        })
-    return sorted(reports, key=lambda x: x["created"], reverse=True)
+    # 一次scandir遍历，每个报告只stat一次
+    with os.scandir(REPORTS_DIR) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".md") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            reports.append({
+                "filename": entry.name,
+                "size": stat.st_size,
+                "created": datetime.fromtimestamp(stat.st_mtime).isoformat()
+            })
+    reports.sort(key=itemgetter("created"), reverse=True)
+    return reports
+
+
+def _reports_etag(reports):
+    """根据报告列表的(文件名, 大小, 修改时间)计算ETag"""
+    digest = hashlib.blake2b(digest_size=16)
+    for report in reports:
+        digest.update(f"{report['filename']}:{report['size']}:{report['created']}\n".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+@app.get("/api/reports")
+async def api_list_reports(request: Request, response: Response):
+    """获取所有分析报告列表"""
+    reports = await asyncio.to_thread(list_reports)
+    etag = _reports_etag(reports)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=_cache_headers(etag))
+
+    response.headers.update(_cache_headers(etag))
+    return reports
 
 
 @app.get("/api/reports/{filename}")
@@ -644,8 +1366,7 @@ async def api_get_report(filename: str):
     if not report_path.exists():
         raise HTTPException(status_code=404, detail="报告不存在")
 
-    with open(report_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    content = await asyncio.to_thread(report_path.read_text, encoding='utf-8')
 
     return {
         "filename": filename,
@@ -660,7 +1381,7 @@ async def api_delete_report(filename: str):
     if not report_path.exists():
         raise HTTPException(status_code=404, detail="报告不存在")
 
-    report_path.unlink()
+    await asyncio.to_thread(report_path.unlink)
     return {"success": True}
 
 